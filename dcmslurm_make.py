@@ -60,6 +60,8 @@ for i in range(len(path_params_list)):
 
 import os
 
+from dcmslurm_make_params import read_params
+
 def replace_in_outline(**kwargs):
 	"""Loads a text outline and replaces all specified keyword strings (in all
 	caps) and replaces the ith keyword string (in the outline) with the ith
@@ -107,12 +109,23 @@ def replace_in_outline(**kwargs):
 			directory_output = os.path.dirname(path_output_filename)
 			if not os.path.exists(directory_output):
 				os.makedirs(directory_output)
-			script = open(path_output_filename, 'wb')
+			script = open(path_output_filename, 'w')
 			script.write(outline_contents)
 			script.close()
 
 	return outline_contents
 
+def parse_labels(label_string):
+	"""Splits the MATLAB-formatted cell array of labels into a list of labels.
+
+	Args:
+		label_string: MATLAB-formatted cell array of labels (e.g.,
+			"{'cond 1', 'cond 2'}")
+	Returns:
+		List of labels
+	"""
+	return [x[1:-1] for x in label_string[1:-1].split(', ')]
+
 def make_parse(filename, **kwargs):
 	"""Loads the outline 'outline_sh.txt' and replaces the ith keyword string
 	(in the outline) with the ith variable. Writes to path_output if specified.
@@ -226,6 +239,36 @@ def make_ttest(filename, **kwargs):
 			**kwargs), \
 		**kwargs)
 
+def make_aggregate(filename, **kwargs):
+	"""Loads the outline 'outline_sbatch.txt' and replaces the ith keyword
+	string (in the outline) with the ith variable. Writes to path_output if
+	specified. Replaces the commands keyword with the commands in
+	'commands_aggregate.txt' (for aggregating the results of every job in
+	path_output into a single structure array).
+
+	Keyword strings are in the format "$KEYWORD$" (i.e., always bookended by
+	dollar signs).
+
+	Args:
+		filename: output file path
+		**kwargs
+			- overwrite: True if overwriting of an existing file is desired
+			- keywords to replace in the outline (not case sensitive)
+	Returns:
+		None
+	"""
+	replace_in_outline( \
+		path_outline='outline_sbatch.txt', \
+		path_output_filename=os.path.join(kwargs['path_output'], filename), \
+		script_name=os.path.splitext(filename)[0], \
+		path_log= '%s.log' % os.path.join(kwargs['path_output'], \
+			os.path.splitext(filename)[0]), \
+		path_err= '%s.err' % os.path.join(kwargs['path_output'], \
+			os.path.splitext(filename)[0]), \
+		commands=replace_in_outline(path_outline='commands_aggregate.txt', \
+			**kwargs), \
+		**kwargs)
+
 def make_run(filename, script_list_estimate, script_list_post, **kwargs):
 	"""Loads the outline 'outline_sh.txt' and replaces the ith keyword string
 	(in the outline) with the ith variable. Writes to path_output if specified.
@@ -334,8 +377,7 @@ def make_scripts(include_parse=True, include_favg=True, include_ttest=True, \
 		make_parse(filename=script_name_parse, **kwargs)
 
 	# create estimate scripts
-	label_string = kwargs['labels']
-	labels = [x[1:-1] for x in label_string[1:-1].split(', ')]
+	labels = parse_labels(kwargs['labels'])
 	subjects = kwargs['subjects']
 	for label in labels:
 		for subject in range(1, subjects+1):
@@ -365,12 +407,24 @@ def make_scripts_all(**kwargs):
 	and accompanying shell scripts for submitting and running all scripts for
 	many parameters.
 
+	The parameter file is read lazily, one record at a time. Only part of it
+	is processed if a byte range (e.g., from plan_chunks in
+	dcmslurm_make_params) or a record range is given, so that independent
+	processes can split the work (each with its own prefix_output). The paths
+	of the run scripts are still kept for the whole range (for the run_all
+	script), so memory is only bounded per range: split large parameter
+	files into chunks.
+
 	Args:
 		**kwargs
 			- path_params: path to the parameter files
 			- directory_output: output directory
 			- prefix_output: any prefix that should go at the beginning of file
 				names
+			- params_byte_first, params_byte_last: byte range of the parameter
+				file to process (default is the whole file)
+			- params_record_first, params_record_last: record range of the
+				parameter file to process (default is all records)
 			- keywords to replace in the outline (not case sensitive)
 	Returns:
 		None
@@ -379,20 +433,14 @@ def make_scripts_all(**kwargs):
 	directory_output = kwargs['directory_output']
 	prefix_output = kwargs['prefix_output']
 
-	file_params = open(path_params, 'r')
-	list_params = []
-	for line in file_params.readlines():
-		line_split = line.split('&')
-		if len(line_split) == 3:
-			params = {}
-			params['matrix_A'] = line_split[0]
-			params['matrix_C'] = line_split[1]
-			params['matrix_hidden'] = line_split[2].replace('\n', '')
-			list_params.append(params)
-	file_params.close()
+	iter_params = read_params(path_params, \
+		byte_first=kwargs.get('params_byte_first', 0), \
+		byte_last=kwargs.get('params_byte_last'), \
+		record_first=kwargs.get('params_record_first', 0), \
+		record_last=kwargs.get('params_record_last'))
 	
 	script_list_run = []
-	for params in list_params:
+	for params in iter_params:
 
 		# job_name is matrix_A and matrix_hidden converted from a binary string
 		string_raw = params['matrix_A'] + params['matrix_hidden']
@@ -59,8 +59,25 @@ for i in range(len(path_params_list)):
 """
 
 import copy
+import getpass
 import itertools
 import os
+import subprocess
+
+def iter_nkstrings(n, k):
+	"""Lazily generates all binary strings of length n with k '1's.
+
+	Args:
+		n: string length
+		k: number of '1's that appear in each string
+	Yields:
+		Binary strings of length n with k '1's
+	"""
+	for bits in itertools.combinations(range(n), k):
+		s = ['0'] * n
+		for bit in bits:
+			s[bit] = '1'
+		yield ''.join(s)
 
 def nkstrings(n, k):
 	"""Returns list of all binary strings of length n with k '1's.
@@ -71,19 +88,13 @@ def nkstrings(n, k):
 	Returns:
 		list_nkstrings: list of binary strings of length n with k '1's
 	"""
-    list_nkstrings = []
-    for bits in itertools.combinations(range(n), k):
-        s = ['0'] * n
-        for bit in bits:
-            s[bit] = '1'
-        list_nkstrings.append(''.join(s))
-    return list_nkstrings
+	return list(iter_nkstrings(n, k))
 
-def matrix_options(n_in = 5, free_connects = 2, \
+def iter_matrix_options(n_in = 5, free_connects = 2, \
 	matrix_A = [], \
-	self_connect = True, dominant_nodes = []):
-	"""Generates the list of A matrices that adhere to a set of specified
-	conditions.
+	self_connect = True, dominant_nodes = [], **kwargs):
+	"""Lazily generates the A matrices that adhere to a set of specified
+	conditions (so that the whole list never needs to be held in memory).
 
 	Args:
 		n_in: number of nodes
@@ -94,8 +105,9 @@ def matrix_options(n_in = 5, free_connects = 2, \
 			the "non-dominant nodes" (i.e., nodes not specified in the list).
 			For instance, given dominant nodes [2, 3], there will always be
 			connections from 1 (non-dominant node) to 2 and 3 (dominant nodes).
-	Returns:
-		matrix_A_list: list of A matrices satisfying the input options
+		**kwargs: other options (e.g., for format_matrix_all), ignored
+	Yields:
+		A matrices satisfying the input options
 	"""
 	if matrix_A == []:
 		n = n_in
@@ -116,8 +128,7 @@ def matrix_options(n_in = 5, free_connects = 2, \
 	for row in matrix_A_out:
 		ast_total += row.count('*')
 
-	matrix_A_list = []
-	for nkstring in nkstrings(ast_total, ast_total-free_connects):
+	for nkstring in iter_nkstrings(ast_total, ast_total-free_connects):
 		matrix_A_temp = copy.deepcopy(matrix_A_out)
 		string_pos = 0
 		for i in range(n):
@@ -125,8 +136,22 @@ def matrix_options(n_in = 5, free_connects = 2, \
 				if matrix_A_temp[i][j] == '*':
 					matrix_A_temp[i][j] = int(nkstring[string_pos])
 					string_pos += 1
-		matrix_A_list.append(matrix_A_temp[:])
-	return matrix_A_list
+		yield matrix_A_temp
+
+def matrix_options(n_in = 5, free_connects = 2, \
+	matrix_A = [], \
+	self_connect = True, dominant_nodes = []):
+	"""Generates the list of A matrices that adhere to a set of specified
+	conditions.
+
+	Args:
+		n_in, free_connects, matrix_A, self_connect, dominant_nodes: see
+			iter_matrix_options
+	Returns:
+		matrix_A_list: list of A matrices satisfying the input options
+	"""
+	return list(iter_matrix_options(n_in, free_connects, matrix_A, \
+		self_connect, dominant_nodes))
 
 def format_matrix(matrix_in):
 	"""Reformats Python list syntax to MATLAB array syntax.
@@ -156,32 +181,265 @@ def format_matrix_all(matrix_A_out = [], matrix_C = [1, 0, 0, 0, 0], \
 	return '%s&%s&%s\n' % (format_matrix(matrix_A_out), \
 		format_matrix(matrix_C), format_matrix(hidden_nodes))
 
-def make_params(filename, path_output, **kwargs):
+def make_params(filename, path_output, models_per_file=60, **kwargs):
 	"""Reformats Python-formatted lists for the A matrix, C matrix, and list of
 	hidden nodes.
 
 	Args:
 		filename: name of the output file (no extension)
 		path_output: directory where the output file should go
-		**kwargs: matrix options to be passed to matrix_options
+		models_per_file: number of models written to each file (all models
+			are written to a single file if None, which can then be split with
+			plan_chunks)
+		**kwargs: matrix options to be passed to iter_matrix_options
 	Returns:
 		List of parameter script paths
 	"""
 	script_list = []
-	matrix_A_list = matrix_options(**kwargs)
 	
 	count = 0
-	for matrix_A_out in matrix_A_list:
-		if count % 60 == 0:
+	for matrix_A_out in iter_matrix_options(**kwargs):
+		if count == 0 or (models_per_file is not None \
+			and count % models_per_file == 0):
 			if count != 0:
 				script.close()
-			num_scripts = count / 60 + 1
+			if models_per_file is None:
+				num_scripts = 1
+			else:
+				num_scripts = count // models_per_file + 1
 			path = os.path.join(path_output, \
 				'%s-%s.txt' % (filename, str(num_scripts)))
 			script_list.append(path)
-			script = open(path, 'wb')
+			script = open(path, 'w')
 		script.write(format_matrix_all(matrix_A_out=matrix_A_out, **kwargs))
 		count += 1
 	script.close()
 
-	return script_list
\ No newline at end of file
+	return script_list
+
+def parse_params_line(line):
+	"""Parses a single line of a parameter file (as written by make_params).
+
+	Args:
+		line: line of the parameter file
+	Returns:
+		Dictionary with the MATLAB-formatted A matrix, C matrix, and list of
+			hidden nodes (None if the line is not a parameter record)
+	"""
+	line_split = line.split('&')
+	if len(line_split) != 3:
+		return None
+	params = {}
+	params['matrix_A'] = line_split[0]
+	params['matrix_C'] = line_split[1]
+	params['matrix_hidden'] = line_split[2].replace('\n', '')
+	return params
+
+def read_params(path_params, byte_first=0, byte_last=None, record_first=0, \
+	record_last=None):
+	"""Lazily reads the records of a parameter file, one line at a time.
+
+	A record belongs to the byte range if its line starts in [byte_first,
+	byte_last), so that adjacent byte ranges (e.g., from plan_chunks) never
+	share or skip a record. The record range is counted from the first record
+	in the byte range.
+
+	Args:
+		path_params: path to the parameter file
+		byte_first: first byte of the byte range
+		byte_last: end (exclusive) of the byte range (default is end of file)
+		record_first: index of the first record to read
+		record_last: end (exclusive) of the record range (default is all
+			records)
+	Yields:
+		Dictionaries of parameters (see parse_params_line)
+	"""
+	file_params = open(path_params, 'rb')
+	try:
+		# skip the line containing byte_first unless it starts there
+		if byte_first > 0:
+			file_params.seek(byte_first - 1)
+			file_params.readline()
+		position = file_params.tell()
+
+		record = 0
+		while byte_last is None or position < byte_last:
+			if record_last is not None and record >= record_last:
+				break
+			line = file_params.readline()
+			if not line:
+				break
+			position += len(line)
+			params = parse_params_line(line.decode('ascii'))
+			if params is None:
+				continue
+			if record >= record_first:
+				yield params
+			record += 1
+	finally:
+		file_params.close()
+
+def sacctmgr_lines(*args):
+	"""Runs a sacctmgr query with parsable output.
+
+	Args:
+		*args: arguments of the query (e.g., 'show', 'qos')
+	Returns:
+		List of output lines (empty if sacctmgr is unavailable or fails)
+	"""
+	try:
+		output = subprocess.check_output(['sacctmgr', '--noheader', \
+			'--parsable2'] + list(args))
+	except (OSError, subprocess.CalledProcessError):
+		return []
+	return [x for x in output.decode('ascii').splitlines() if x != '']
+
+def max_submit_jobs(user=None, qos='normal'):
+	"""Returns the maximum number of jobs the user may have submitted at once
+	according to the SLURM association limits (MaxSubmitJobs) and the limit
+	of the QOS the jobs are submitted with (MaxSubmitPU).
+
+	Args:
+		user: user name (default is the current user)
+		qos: QOS the jobs are submitted with (default is the QOS in
+			'outline_sbatch.txt')
+	Returns:
+		Smallest of the limits (None if no limit is set or sacctmgr is
+			unavailable)
+	"""
+	if user is None:
+		user = getpass.getuser()
+
+	limits = []
+	for line in sacctmgr_lines('show', 'assoc', 'user=%s' % user, \
+		'format=MaxSubmitJobs'):
+		if line.isdigit():
+			limits.append(int(line))
+
+	for line in sacctmgr_lines('show', 'qos', 'name=%s' % qos, \
+		'format=Name,MaxSubmitPU'):
+		line_split = line.split('|')
+		if len(line_split) == 2 and line_split[0] == qos and \
+			line_split[1].isdigit():
+			limits.append(int(line_split[1]))
+
+	if len(limits) == 0:
+		return None
+	return min(limits)
+
+def records_per_chunk(max_jobs, n_labels, subjects, include_favg=True, \
+	include_ttest=True, post_per_label=False, include_aggregate=False, \
+	records_default=60):
+	"""Returns the number of parameter records whose jobs fit within a limit
+	on the number of submitted jobs.
+
+	Args:
+		max_jobs: maximum number of jobs per chunk (e.g., from
+			max_submit_jobs); records_default is returned if None
+		n_labels: number of labels for the experimental conditions
+		subjects: number of subjects
+		include_favg: True if favg jobs are submitted
+		include_ttest: True if ttest jobs are submitted
+		post_per_label: True if the favg and ttest jobs are submitted for
+			each label (as by dcmslurm_monitor) rather than once per record
+			(as by the run scripts)
+		include_aggregate: True if one aggregation job is submitted per chunk
+			(as by dcmslurm_monitor)
+		records_default: number of records per chunk if there is no limit
+			(default is the number of models per file of make_params)
+	Returns:
+		Number of records per chunk (at least 1)
+	"""
+	if max_jobs is None:
+		return records_default
+
+	jobs_post = 0
+	if include_favg:
+		jobs_post += 1
+	if include_ttest:
+		jobs_post += 1
+	if post_per_label:
+		jobs_post *= n_labels
+	jobs_per_record = n_labels * subjects + jobs_post
+
+	if include_aggregate:
+		max_jobs -= 1
+	return max(1, max_jobs // jobs_per_record)
+
+def plan_chunks(path_params, records=None, size=None):
+	"""Splits a parameter file into byte ranges that can be passed to
+	make_scripts_all (as params_byte_first and params_byte_last) by
+	independent processes.
+
+	If records is given, the file is read once (one line at a time) and each
+	range holds that many records. Otherwise, if size is given, each range
+	holds roughly size bytes and only the line endings at the boundaries are
+	read. If neither is given, the whole file is a single range.
+
+	Args:
+		path_params: path to the parameter file
+		records: number of records per chunk
+		size: number of bytes per chunk
+	Returns:
+		List of (byte_first, byte_last) tuples covering the whole file
+	"""
+	if records is not None and records < 1:
+		raise ValueError('records must be at least 1 (got %s)' % records)
+	if size is not None and size < 1:
+		raise ValueError('size must be at least 1 (got %s)' % size)
+
+	size_file = os.path.getsize(path_params)
+	boundaries = [0]
+
+	file_params = open(path_params, 'rb')
+	if records is not None:
+		count = 0
+		position = 0
+		line = file_params.readline()
+		while line:
+			if parse_params_line(line.decode('ascii')) is not None:
+				if count != 0 and count % records == 0:
+					boundaries.append(position)
+				count += 1
+			position += len(line)
+			line = file_params.readline()
+	elif size is not None:
+		position = size
+		while position < size_file:
+			# move the boundary to the start of the next line
+			file_params.seek(position - 1)
+			file_params.readline()
+			position = file_params.tell()
+			if position >= size_file:
+				break
+			boundaries.append(position)
+			position += size
+	file_params.close()
+
+	boundaries.append(size_file)
+	return [(boundaries[i], boundaries[i+1]) \
+		for i in range(len(boundaries) - 1)]
+
+def plan_chunks_from_limits(path_params, n_labels, subjects, max_jobs=None, \
+	qos='normal', records_default=60, **kwargs):
+	"""Splits a parameter file into byte ranges (see plan_chunks) such that
+	the jobs of each range fit within the scheduler's submit limit.
+
+	Args:
+		path_params: path to the parameter file
+		n_labels: number of labels for the experimental conditions
+		subjects: number of subjects
+		max_jobs: maximum number of jobs per chunk (default is the limit from
+			max_submit_jobs)
+		qos: QOS the jobs are submitted with (see max_submit_jobs)
+		records_default: number of records per chunk if there is no limit
+		**kwargs: post-processing options (include_favg, include_ttest,
+			post_per_label, include_aggregate) passed to records_per_chunk
+	Returns:
+		List of (byte_first, byte_last) tuples covering the whole file
+	"""
+	if max_jobs is None:
+		max_jobs = max_submit_jobs(qos=qos)
+	records = records_per_chunk(max_jobs, n_labels, subjects, \
+		records_default=records_default, **kwargs)
+	return plan_chunks(path_params, records=records)
@@ -0,0 +1,422 @@
+"""dcmuslurm_monitor.py
+Monitors a directory of DCM estimation jobs while they run. Keeps an in-memory
+view of the finished, failed, and pending tasks for each job (set of
+parameters) and label, and submits the "post-processing" scripts (favg and
+ttest) for a label as soon as none of its subjects are pending (dcmslurm_favg
+and dcmslurm_ttest skip subjects without output, as with the afterany
+dependency in the run scripts). Once every expected job has been found and
+none of its tasks are pending, the aggregation script is submitted.
+
+Each scan is incremental: the output directory is only listed again when its
+modification time changes (or may have changed within the resolution of the
+file system), finished tasks are never checked again, and the log of a
+pending task is only read when its size has changed.
+
+Since the monitor submits the post-processing scripts itself, the scripts
+should be generated without them (i.e., pass include_favg=False and
+include_ttest=False to make_scripts_all). A script counts as submitted once
+sbatch has succeeded (recorded in a ".submitted" file next to the script), so
+scripts that failed to submit (e.g., because of the submit limit) are
+submitted again on the next update. An example script follows below.
+
+_______________________________________________________________________________
+Example script:
+
+path_dcmslurm = '/home/usr/dcm/dcmslurm'
+path_spm = '/home/usr/dcm/spm12beta'
+
+import sys
+sys.path.append(path_dcmslurm)
+from dcmslurm_monitor import Monitor
+
+monitor = Monitor( \
+	directory_output = '/scratch/users/usr/dcm_data/brain_data_output', \
+	prefix_output = 'brain_data', \
+	path_params = '/scratch/users/usr/dcm_data/brain_data_params-1.txt', \
+	path_dcmslurm = path_dcmslurm, \
+	path_spm = path_spm, \
+	labels = "{'cond 1', 'cond 2', 'cond 3'}", \
+	subjects = 16, \
+	time = '00:10:00', \
+	partition = 'normal', \
+	nodes = 1, \
+	memory = 700)
+monitor.run(interval=60)
+"""
+
+import os
+import subprocess
+import time
+
+from dcmslurm_make import make_aggregate, make_favg, make_ttest, parse_labels
+from dcmslurm_make_params import read_params
+
+STATUS_FINISHED = 'finished'
+STATUS_FAILED = 'failed'
+STATUS_PENDING = 'pending'
+
+# dcmslurm_estimate prints one of these to the log once a subject is done
+LOG_MARKERS = ['Subject %d estimated', 'Incomplete data for subject %d']
+
+# number of bytes at the end of a log that are searched for the markers
+LOG_TAIL_SIZE = 4096
+
+# coarsest modification time resolution expected (in seconds); e.g., NFS and
+# Lustre only keep whole seconds
+MTIME_RESOLUTION = 1
+
+def submit_sbatch(path_script):
+	"""Submits a batch script with sbatch.
+
+	Args:
+		path_script: path to the batch script
+	Returns:
+		Output of sbatch (e.g., 'Submitted batch job 1234')
+	"""
+	return subprocess.check_output(['sbatch', path_script])
+
+def read_log_tail(path_log, size=LOG_TAIL_SIZE):
+	"""Reads the end of a log file.
+
+	Args:
+		path_log: path to the log file
+		size: maximum number of bytes to read
+	Returns:
+		The last size bytes of the log file as a string
+	"""
+	log = open(path_log, 'rb')
+	log.seek(0, os.SEEK_END)
+	log.seek(max(0, log.tell() - size))
+	contents = log.read().decode('utf-8', 'replace')
+	log.close()
+	return contents
+
+def count_jobs(path_params, **kwargs):
+	"""Returns the number of jobs make_scripts_all makes for the given
+	parameter files (i.e., the number of parameter records).
+
+	Args:
+		path_params: path to the parameter file (or list of paths)
+		**kwargs
+			- params_byte_first, params_byte_last, params_record_first,
+				params_record_last: ranges of the parameter file (see
+				make_scripts_all)
+	Returns:
+		Number of jobs
+	"""
+	if not isinstance(path_params, (list, tuple)):
+		path_params = [path_params]
+	n_jobs = 0
+	for path in path_params:
+		for params in read_params(path, \
+			byte_first=kwargs.get('params_byte_first', 0), \
+			byte_last=kwargs.get('params_byte_last'), \
+			record_first=kwargs.get('params_record_first', 0), \
+			record_last=kwargs.get('params_record_last')):
+			n_jobs += 1
+	return n_jobs
+
+class Monitor(object):
+	"""Tracks the estimation tasks in directory_output and submits the
+	post-processing scripts for each label once none of its tasks are pending.
+
+	Attributes:
+		directory_output: output directory (containing one directory per job)
+		labels: list of labels for the experimental conditions
+		subjects: number of subjects
+		n_jobs: number of jobs expected in directory_output
+		jobs: dictionary mapping each job name to a dictionary mapping each
+			label to a dictionary mapping each subject to its status
+		launched: set of the (job_name, label) pairs (and the prefix for the
+			aggregation) for which scripts have been submitted
+	"""
+
+	def __init__(self, directory_output, n_jobs=None, submit=submit_sbatch, \
+		include_favg=True, include_ttest=True, include_aggregate=True, \
+		**kwargs):
+		"""
+		Args:
+			directory_output: output directory
+			n_jobs: number of jobs expected in directory_output (default is
+				the number of records in path_params)
+			submit: function called with the path of each batch script to be
+				submitted (default is submit_sbatch)
+			include_favg: True if favg scripts should be submitted
+			include_ttest: True if ttest scripts should be submitted
+			include_aggregate: True if the aggregation script should be
+				submitted
+			**kwargs
+				- labels: labels for the experimental conditions
+				- subjects: number of subjects
+				- prefix_output: only directories starting with prefix_output
+					are jobs; also the prefix of the aggregation script
+					(default is the name of directory_output)
+				- path_params: path to the parameter file (or list of paths)
+					used to count the jobs if n_jobs is not given (ranges are
+					given as for make_scripts_all)
+				- keywords to replace in the outline (not case sensitive)
+		"""
+		# replace_in_outline changes the working directory, so all paths must
+		# be absolute
+		directory_output = os.path.abspath(directory_output)
+		for key in kwargs:
+			if key.startswith('path_') or key.startswith('directory_'):
+				if isinstance(kwargs[key], (list, tuple)):
+					kwargs[key] = [os.path.abspath(x) for x in kwargs[key]]
+				else:
+					kwargs[key] = os.path.abspath(kwargs[key])
+
+		if n_jobs is None:
+			if 'path_params' not in kwargs:
+				raise ValueError('n_jobs or path_params is required')
+			n_jobs = count_jobs(**kwargs)
+
+		self.directory_output = directory_output
+		self.n_jobs = n_jobs
+		self.submit = submit
+		self.include_favg = include_favg
+		self.include_ttest = include_ttest
+		self.include_aggregate = include_aggregate
+		self.kwargs = kwargs
+
+		self.labels = parse_labels(kwargs['labels'])
+		self.subjects = kwargs['subjects']
+		if 'prefix_output' in kwargs:
+			self.prefix_output = kwargs['prefix_output']
+			self._prefix_job = '%s_' % self.prefix_output
+		else:
+			self.prefix_output = os.path.basename( \
+				os.path.normpath(directory_output))
+			self._prefix_job = ''
+
+		self.jobs = {}
+		self.launched = set()
+
+		# directories that have not (yet) been recognized as jobs
+		self._candidates = set()
+		self._mtime_output = None
+		self._time_listed = None
+		# size of each log of a pending task when it was last read
+		self._log_sizes = {}
+
+	def _discover(self):
+		"""Adds any new job directories in directory_output. A directory is
+		recognized as a job once its run script (written last by make_scripts)
+		exists.
+		"""
+		try:
+			mtime_output = os.stat(self.directory_output).st_mtime
+		except OSError:
+			return
+
+		# the directory may have changed without changing its mtime if it
+		# was listed within MTIME_RESOLUTION of its last modification
+		if mtime_output != self._mtime_output or \
+			self._time_listed - mtime_output <= MTIME_RESOLUTION:
+			self._mtime_output = mtime_output
+			self._time_listed = time.time()
+			for name in os.listdir(self.directory_output):
+				if name not in self.jobs and \
+					name.startswith(self._prefix_job) and os.path.isdir( \
+					os.path.join(self.directory_output, name)):
+					self._candidates.add(name)
+
+		for job_name in sorted(self._candidates):
+			if os.path.exists('%s-run.sh' \
+				% os.path.join(self.directory_output, job_name, job_name)):
+				self._candidates.remove(job_name)
+				self.jobs[job_name] = dict((label, dict((subject, \
+					STATUS_PENDING) for subject in range(1, \
+					self.subjects+1))) for label in self.labels)
+
+	def _task_status(self, job_name, label, subject):
+		"""Returns the status of the estimation task for a single subject.
+		A task has failed if its error file is not empty and has finished if
+		its log shows that dcmslurm_estimate is done with the subject.
+		"""
+		path_base = os.path.join(self.directory_output, job_name, \
+			'%s-%s-%s' % (job_name, label, str(subject)))
+
+		path_error = '%s.err' % path_base
+		if os.path.exists(path_error) and os.stat(path_error).st_size != 0:
+			return STATUS_FAILED
+
+		path_log = '%s.log' % path_base
+		try:
+			size_log = os.stat(path_log).st_size
+		except OSError:
+			return STATUS_PENDING
+		if self._log_sizes.get(path_log) == size_log:
+			return STATUS_PENDING
+		self._log_sizes[path_log] = size_log
+
+		log_tail = read_log_tail(path_log)
+		for marker in LOG_MARKERS:
+			if marker % subject in log_tail:
+				del self._log_sizes[path_log]
+				return STATUS_FINISHED
+		return STATUS_PENDING
+
+	def _submit_script(self, make_function, script_name, **kwargs):
+		"""Writes and submits a single script unless it has already been
+		submitted (e.g., by a previous monitor). A successful submission is
+		recorded in a ".submitted" file next to the script; a failed one is
+		reported and tried again on the next update.
+
+		Returns:
+			True if the script has been submitted
+		"""
+		path_script = os.path.join(kwargs['path_output'], script_name)
+		path_submitted = '%s.submitted' % path_script
+		if os.path.exists(path_submitted):
+			return True
+
+		make_function(filename=script_name, **kwargs)
+		try:
+			output = self.submit(path_script)
+		except (OSError, subprocess.CalledProcessError) as error:
+			print('Submitting %s failed (retrying on the next update): %s' \
+				% (path_script, error))
+			return False
+
+		submitted = open(path_submitted, 'w')
+		if output is not None:
+			if not isinstance(output, str):
+				output = output.decode('ascii', 'replace')
+			submitted.write(output)
+		submitted.close()
+		return True
+
+	def _submit_post(self, job_name, label):
+		"""Writes and submits the favg and ttest scripts for a single label of
+		a job.
+
+		Returns:
+			True if all of the scripts have been submitted
+		"""
+		kwargs = dict(self.kwargs)
+		kwargs.update( \
+			path_output=os.path.join(self.directory_output, job_name), \
+			job_name=job_name, \
+			labels="{'%s'}" % label)
+
+		make_list = []
+		if self.include_favg:
+			make_list.append((make_favg, 'favg'))
+		if self.include_ttest:
+			make_list.append((make_ttest, 'ttest'))
+
+		submitted_all = True
+		for make_function, suffix in make_list:
+			script_name = '%s-%s-%s.sbatch' % (job_name, label, suffix)
+			if not self._submit_script(make_function, script_name, **kwargs):
+				submitted_all = False
+		return submitted_all
+
+	def _submit_aggregate(self):
+		"""Writes and submits the script aggregating the results of all jobs.
+
+		Returns:
+			True if the script has been submitted
+		"""
+		kwargs = dict(self.kwargs)
+		kwargs.update( \
+			path_output=self.directory_output, \
+			job_name=self.prefix_output, \
+			n_matrices=self.n_jobs)
+
+		script_name = '%s-aggregate.sbatch' % self.prefix_output
+		return self._submit_script(make_aggregate, script_name, **kwargs)
+
+	def _launched_all_post(self):
+		"""Returns True if every expected job has been found and the
+		post-processing for all of its labels has been submitted.
+		"""
+		return len(self.jobs) >= self.n_jobs and \
+			all((job_name, label) in self.launched \
+			for job_name in self.jobs for label in self.labels)
+
+	def update(self):
+		"""Scans directory_output for changes, updates the status of all
+		unfinished tasks, and submits the scripts for the labels with no
+		pending tasks.
+
+		Returns:
+			Status summary (see summary)
+		"""
+		self._discover()
+
+		for job_name in sorted(self.jobs):
+			for label in self.labels:
+				statuses = self.jobs[job_name][label]
+				for subject in statuses:
+					if statuses[subject] != STATUS_FINISHED:
+						statuses[subject] = self._task_status(job_name, \
+							label, subject)
+
+				if (job_name, label) not in self.launched and \
+					STATUS_PENDING not in statuses.values():
+					if self._submit_post(job_name, label):
+						self.launched.add((job_name, label))
+
+		if self.include_aggregate and \
+			self.prefix_output not in self.launched and \
+			self._launched_all_post():
+			if self._submit_aggregate():
+				self.launched.add(self.prefix_output)
+
+		return self.summary()
+
+	def summary(self):
+		"""Returns the number of finished, failed, and pending tasks without
+		scanning directory_output.
+
+		Returns:
+			Dictionary with the total number of tasks for each status, the
+				number of jobs found ('jobs_found') and expected
+				('jobs_expected'), and, under 'jobs', the number of tasks for
+				each status for each job and label
+		"""
+		summary = {STATUS_FINISHED: 0, STATUS_FAILED: 0, STATUS_PENDING: 0, \
+			'jobs_found': len(self.jobs), 'jobs_expected': self.n_jobs, \
+			'jobs': {}}
+		for job_name in self.jobs:
+			summary['jobs'][job_name] = {}
+			for label in self.labels:
+				counts = {STATUS_FINISHED: 0, STATUS_FAILED: 0, \
+					STATUS_PENDING: 0}
+				for status in self.jobs[job_name][label].values():
+					counts[status] += 1
+					summary[status] += 1
+				summary['jobs'][job_name][label] = counts
+		return summary
+
+	def done(self):
+		"""Returns True if every expected job has been found, none of its
+		tasks are pending, and every script that the monitor submits has been
+		submitted.
+		"""
+		if not self._launched_all_post():
+			return False
+		return not self.include_aggregate or \
+			self.prefix_output in self.launched
+
+	def run(self, interval=60):
+		"""Updates every interval seconds (printing the status summary) until
+		every script has been submitted.
+
+		Args:
+			interval: number of seconds between updates
+		Returns:
+			None
+		"""
+		while True:
+			summary = self.update()
+			print('%s: %d/%d jobs found, %d finished, %d failed, %d pending' \
+				% (time.strftime('%Y-%m-%d %H:%M:%S'), \
+				summary['jobs_found'], summary['jobs_expected'], \
+				summary[STATUS_FINISHED], summary[STATUS_FAILED], \
+				summary[STATUS_PENDING]))
+			if self.done():
+				break
+			time.sleep(interval)
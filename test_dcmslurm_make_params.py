@@ -0,0 +1,76 @@
+"""test_dcmslurm_make_params.py
+Tests for reading and splitting parameter files in dcmslurm_make_params. Run
+with python -m unittest test_dcmslurm_make_params (or pytest).
+"""
+
+import shutil
+import tempfile
+import unittest
+
+import dcmslurm_make_params
+
+class TestParams(unittest.TestCase):
+
+	def setUp(self):
+		self.path_output = tempfile.mkdtemp()
+		self.path_params = dcmslurm_make_params.make_params( \
+			filename='params', \
+			path_output=self.path_output, \
+			models_per_file=None, \
+			n_in=5, \
+			free_connects=2, \
+			self_connect=True, \
+			dominant_nodes=[1])[0]
+		self.list_params = list(dcmslurm_make_params.read_params( \
+			self.path_params))
+
+	def tearDown(self):
+		shutil.rmtree(self.path_output)
+
+	def read_chunks(self, chunks):
+		return [params for byte_first, byte_last in chunks \
+			for params in dcmslurm_make_params.read_params(self.path_params, \
+			byte_first, byte_last)]
+
+	def test_matrix_options_positional(self):
+		self.assertEqual(len(dcmslurm_make_params.matrix_options(4, 2)), 66)
+		self.assertEqual(len(self.list_params), 120)
+
+	def test_chunks_cover_file(self):
+		for kwargs in [{'records': 7}, {'size': 1}, {'size': 100}, \
+			{'size': 10**6}, {}]:
+			chunks = dcmslurm_make_params.plan_chunks(self.path_params, \
+				**kwargs)
+			self.assertEqual(self.read_chunks(chunks), self.list_params)
+
+	def test_record_range(self):
+		self.assertEqual(list(dcmslurm_make_params.read_params( \
+			self.path_params, record_first=3, record_last=5)), \
+			self.list_params[3:5])
+
+	def test_invalid_chunk_size(self):
+		for kwargs in [{'records': 0}, {'size': 0}, {'size': -1}]:
+			self.assertRaises(ValueError, dcmslurm_make_params.plan_chunks, \
+				self.path_params, **kwargs)
+
+	def test_chunks_from_limits(self):
+		# 2 labels * 3 subjects + favg + ttest = 8 jobs per record
+		chunks = dcmslurm_make_params.plan_chunks_from_limits( \
+			self.path_params, n_labels=2, subjects=3, max_jobs=80)
+		self.assertEqual(len(chunks), 12)
+		self.assertEqual(self.read_chunks(chunks), self.list_params)
+
+	def test_chunks_per_label_post(self):
+		# 2 labels * 3 subjects + 2 * (favg + ttest) = 10 jobs per record and
+		# one aggregation job per chunk
+		self.assertEqual(dcmslurm_make_params.records_per_chunk(81, 2, 3, \
+			post_per_label=True, include_aggregate=True), 8)
+		self.assertEqual(dcmslurm_make_params.records_per_chunk(80, 2, 3, \
+			post_per_label=True, include_aggregate=True), 7)
+
+	def test_no_limit_fallback(self):
+		self.assertEqual(dcmslurm_make_params.records_per_chunk(None, 2, 3, \
+			records_default=25), 25)
+
+if __name__ == '__main__':
+	unittest.main()
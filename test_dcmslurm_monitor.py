@@ -0,0 +1,202 @@
+"""test_dcmslurm_monitor.py
+Drives dcmslurm_monitor against a synthetic output tree written by this
+script (fake run scripts, logs, and error files) instead of SLURM. Run with
+python -m unittest test_dcmslurm_monitor (or pytest).
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from dcmslurm_monitor import Monitor
+
+def write_job(directory_output, job_name):
+	"""Writes the run script that marks a job directory as complete."""
+	path_output = os.path.join(directory_output, job_name)
+	os.makedirs(path_output)
+	open('%s-run.sh' % os.path.join(path_output, job_name), 'w').close()
+
+def write_task(directory_output, job_name, label, subject, error=''):
+	"""Writes the log (and error file) of a finished estimation task."""
+	path_base = os.path.join(directory_output, job_name, \
+		'%s-%s-%s' % (job_name, label, str(subject)))
+	log = open('%s.log' % path_base, 'w')
+	log.write('\nSubject %d estimated\n\n' % subject)
+	log.close()
+	err = open('%s.err' % path_base, 'w')
+	err.write(error)
+	err.close()
+
+def write_job_finished(directory_output, job_name, labels, subjects):
+	"""Writes a job directory in which every task has finished."""
+	write_job(directory_output, job_name)
+	for label in labels:
+		for subject in range(1, subjects+1):
+			write_task(directory_output, job_name, label, subject)
+
+class TestMonitor(unittest.TestCase):
+
+	def setUp(self):
+		self.directory_output = tempfile.mkdtemp()
+		self.submitted = []
+
+	def tearDown(self):
+		shutil.rmtree(self.directory_output)
+
+	def submit(self, path_script):
+		self.submitted.append(path_script)
+
+	def make_monitor(self, n_jobs, directory_output=None, submit=None):
+		if directory_output is None:
+			directory_output = self.directory_output
+		if submit is None:
+			submit = self.submit
+		return Monitor(directory_output, n_jobs=n_jobs, \
+			submit=submit, \
+			prefix_output='b', \
+			labels="{'c1', 'c2'}", \
+			subjects=2, \
+			path_dcmslurm='dcmslurm', \
+			path_spm='spm', \
+			time='00:10:00', \
+			partition='normal', \
+			nodes=1, \
+			memory=700)
+
+	def read_submitted(self, script_name):
+		for path_script in self.submitted:
+			if os.path.basename(path_script) == script_name:
+				script = open(path_script, 'r')
+				contents = script.read()
+				script.close()
+				return contents
+		self.fail('%s was not submitted' % script_name)
+
+	def test_post_submitted_per_label(self):
+		monitor = self.make_monitor(1)
+		write_job(self.directory_output, 'b_1')
+		self.assertEqual(monitor.update()['pending'], 4)
+
+		write_task(self.directory_output, 'b_1', 'c1', 1)
+		write_task(self.directory_output, 'b_1', 'c1', 2)
+		summary = monitor.update()
+		self.assertEqual(summary['jobs']['b_1']['c1']['finished'], 2)
+		self.assertEqual(summary['jobs']['b_1']['c2']['pending'], 2)
+		self.assertEqual([os.path.basename(x) for x in self.submitted], \
+			['b_1-c1-favg.sbatch', 'b_1-c1-ttest.sbatch'])
+		self.assertIn("labels = {'c1'};", \
+			self.read_submitted('b_1-c1-favg.sbatch'))
+		self.assertFalse(monitor.done())
+
+		write_task(self.directory_output, 'b_1', 'c2', 1)
+		write_task(self.directory_output, 'b_1', 'c2', 2)
+		monitor.update()
+		self.assertEqual(len(self.submitted), 5)
+		self.assertIn('n_matrices = 1;', \
+			self.read_submitted('b-aggregate.sbatch'))
+		self.assertTrue(monitor.done())
+
+	def test_failed_task_ends_label(self):
+		monitor = self.make_monitor(1)
+		write_job(self.directory_output, 'b_1')
+		write_task(self.directory_output, 'b_1', 'c1', 1)
+		write_task(self.directory_output, 'b_1', 'c1', 2, error='Error\n')
+		write_task(self.directory_output, 'b_1', 'c2', 1)
+		write_task(self.directory_output, 'b_1', 'c2', 2)
+
+		summary = monitor.update()
+		self.assertEqual(summary['finished'], 3)
+		self.assertEqual(summary['failed'], 1)
+		self.assertEqual(summary['pending'], 0)
+		self.read_submitted('b_1-c1-favg.sbatch')
+		self.read_submitted('b-aggregate.sbatch')
+		self.assertTrue(monitor.done())
+
+	def test_aggregate_waits_for_expected_jobs(self):
+		monitor = self.make_monitor(4)
+		write_job_finished(self.directory_output, 'b_1', ['c1', 'c2'], 2)
+		write_job_finished(self.directory_output, 'b_2', ['c1', 'c2'], 2)
+
+		summary = monitor.update()
+		self.assertEqual(summary['jobs_found'], 2)
+		self.assertEqual(len(self.submitted), 8)
+		self.assertFalse(monitor.done())
+
+		write_job_finished(self.directory_output, 'b_3', ['c1', 'c2'], 2)
+		write_job_finished(self.directory_output, 'b_4', ['c1', 'c2'], 2)
+		monitor.update()
+		self.assertIn('n_matrices = 4;', \
+			self.read_submitted('b-aggregate.sbatch'))
+		self.assertTrue(monitor.done())
+
+	def test_job_created_within_mtime_resolution(self):
+		monitor = self.make_monitor(2)
+		write_job(self.directory_output, 'b_1')
+		monitor.update()
+		mtime_output = os.stat(self.directory_output).st_mtime
+
+		# a file system with coarse mtimes would not change the mtime
+		write_job(self.directory_output, 'b_2')
+		os.utime(self.directory_output, (mtime_output, mtime_output))
+		self.assertEqual(monitor.update()['jobs_found'], 2)
+
+	def test_relative_directory_output(self):
+		directory_current = os.getcwd()
+		os.chdir(self.directory_output)
+		try:
+			monitor = self.make_monitor(1, directory_output='out')
+		finally:
+			os.chdir(directory_current)
+		directory_output = os.path.join(self.directory_output, 'out')
+		os.makedirs(directory_output)
+		write_job(directory_output, 'b_1')
+		write_task(directory_output, 'b_1', 'c1', 1)
+		write_task(directory_output, 'b_1', 'c1', 2)
+
+		# the first submission changes the working directory
+		monitor.update()
+		self.assertTrue(os.path.exists(os.path.join(directory_output, \
+			'b_1', 'b_1-c1-favg.sbatch')))
+
+		write_task(directory_output, 'b_1', 'c2', 1)
+		write_task(directory_output, 'b_1', 'c2', 2)
+		self.assertEqual(monitor.update()['finished'], 4)
+		self.assertTrue(monitor.done())
+
+	def test_failed_submission_retried(self):
+		failures = ['b_1-c1-ttest.sbatch']
+		def submit(path_script):
+			if os.path.basename(path_script) in failures:
+				failures.remove(os.path.basename(path_script))
+				raise subprocess.CalledProcessError(1, 'sbatch')
+			self.submitted.append(path_script)
+
+		monitor = self.make_monitor(1, submit=submit)
+		write_job_finished(self.directory_output, 'b_1', ['c1', 'c2'], 2)
+		monitor.update()
+		self.assertNotIn(('b_1', 'c1'), monitor.launched)
+		self.assertFalse(monitor.done())
+
+		# a new monitor must not skip the script that failed
+		monitor = self.make_monitor(1, submit=submit)
+		monitor.update()
+		self.assertEqual(sorted(os.path.basename(x) \
+			for x in self.submitted), ['b-aggregate.sbatch', \
+			'b_1-c1-favg.sbatch', 'b_1-c1-ttest.sbatch', \
+			'b_1-c2-favg.sbatch', 'b_1-c2-ttest.sbatch'])
+		self.assertTrue(monitor.done())
+
+	def test_other_directories_ignored(self):
+		monitor = self.make_monitor(1)
+		write_job(self.directory_output, 'other_1')
+		write_job(self.directory_output, 'b_1')
+		self.assertEqual(sorted(monitor.update()['jobs']), ['b_1'])
+
+	def test_expected_jobs_required(self):
+		self.assertRaises(ValueError, Monitor, self.directory_output, \
+			labels="{'c1'}", subjects=1)
+
+if __name__ == '__main__':
+	unittest.main()